@@ -3,205 +3,379 @@ from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.exceptions import RequestValidationError
+from fastapi.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Receive, Scope, Send
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 from typing import Optional, Dict
-import uuid
-import pandas as pd
-from datetime import datetime, timedelta
+from collections import deque
+from cachetools import TTLCache
+from datetime import datetime
+import asyncio
 import hashlib
+import hmac
+import itertools
 import os
+import secrets
 import csv
+import threading
 import uvicorn
 
+_sha256 = hashlib.sha256
+
 class Config:
     USERS_CSV = 'data/users.csv'
     LOGS_CSV = 'data/logs.csv'
-    SESSION_TTL = timedelta(minutes=30)
+    TEMPLATES_DIR = 'templates'
+    TEMPLATES_CACHE_DIR = '.jinja_cache'
+    TEMPLATES_AUTO_RELOAD = os.getenv("APP_MODE") == "test"
+    SESSION_TTL = 30 * 60
+    SESSION_MAX_COUNT = 100_000
+    RECENT_LOGS_LIMIT = 200
+    USERS_FLUSH_BATCH = 50
+    USERS_FLUSH_INTERVAL = 0.1
+    USERS_RETRY_INTERVAL = 5
+    USERNAME_MAX_LENGTH = 64
+    LOGIN_MAX_ATTEMPTS = 5
+    LOGIN_BLOCK_TTL = 5 * 60
+    LOGIN_TRACKED_CLIENTS = 100_000
     ADMIN_LOGIN = "admin"
     ADMIN_PASSWORD = "12345"
-    WHITE_URLS = {"/", "/login", "/logout", "/register"}
+    WHITE_URLS = frozenset({"/", "/login", "/logout", "/register"})
 
 class UserService:
+    FIELDS = ("username", "password", "role", "created_at")
+
     def __init__(self, config: Config):
         self.config = config
+        self._users: Dict[str, dict] = {}
+        self._users_lock = threading.Lock()
+        self._pending_users: Optional[asyncio.Queue] = None
+        self._users_writer: Optional[asyncio.Task] = None
+        self._recent_logs: deque = deque(maxlen=config.RECENT_LOGS_LIMIT)
+        self._log_file = None
+        self._log_lock = threading.Lock()
         self._ensure_data_directory()
+        self._load_users()
+        self._load_recent_logs()
         self._ensure_admin_user()
 
     def _ensure_data_directory(self):
         os.makedirs('data', exist_ok=True)
 
     def _ensure_admin_user(self):
-        if not os.path.exists(self.config.USERS_CSV):
-            df = pd.DataFrame(columns=["username", "password", "role", "created_at"])
-            df.to_csv(self.config.USERS_CSV, index=False, encoding="utf-8")
-
-        users = self.get_all_users()
-        if self.config.ADMIN_LOGIN not in users["username"].values:
-            admin_hash = self._hash_password(self.config.ADMIN_PASSWORD)
-            new_admin = pd.DataFrame([[
-                self.config.ADMIN_LOGIN, 
-                admin_hash, 
-                "admin",
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            ]], columns=["username", "password", "role", "created_at"])
-            
-            users = pd.concat([users, new_admin], ignore_index=True)
-            users.to_csv(self.config.USERS_CSV, index=False, encoding="utf-8")
+        if self.config.ADMIN_LOGIN not in self._users:
+            self.create_user(self.config.ADMIN_LOGIN, self.config.ADMIN_PASSWORD, "admin")
             self.write_log("INFO", "Создан администратор по умолчанию", self.config.ADMIN_LOGIN)
 
-    def _hash_password(self, password: str) -> str:
-        return hashlib.sha256(password.encode()).hexdigest()
+    def _load_users(self):
+        if not os.path.exists(self.config.USERS_CSV):
+            with open(self.config.USERS_CSV, mode="w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(self.FIELDS)
+
+        with open(self.config.USERS_CSV, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                user = {key: (row.get(key) or "").strip() for key in self.FIELDS}
+                if user["username"]:
+                    self._users[user["username"]] = user
+
+    def _load_recent_logs(self):
+        if os.path.exists(self.config.LOGS_CSV):
+            with open(self.config.LOGS_CSV, newline="", encoding="utf-8") as f:
+                self._recent_logs.extend(csv.DictReader(f))
+
+    def _open_log_file(self):
+        self._log_file = open(self.config.LOGS_CSV, mode="a", buffering=1, newline="", encoding="utf-8")
+        self._log_writer = csv.writer(self._log_file)
+        if self._log_file.tell() == 0:
+            self._log_writer.writerow(["timestamp", "level", "event", "username", "extra"])
 
-    def get_all_users(self) -> pd.DataFrame:
-        if os.path.exists(self.config.USERS_CSV):
-            return pd.read_csv(self.config.USERS_CSV, encoding="utf-8")
-        return pd.DataFrame(columns=["username", "password", "role", "created_at"])
+    def _hash_password(self, password: str) -> bytes:
+        return _sha256(password.encode("utf-8")).digest()
+
+    def _export_user(self, user: dict) -> dict:
+        password = user["password"]
+        return {**user, "password": password.hex() if isinstance(password, bytes) else password}
+
+    def get_all_users(self) -> list:
+        return [self._export_user(user) for user in list(self._users.values())]
+
+    def is_valid_username(self, username: str) -> bool:
+        return len(username) <= self.config.USERNAME_MAX_LENGTH and username.isprintable()
 
     def get_user(self, username: str) -> Optional[dict]:
-        users = self.get_all_users()
-        user_data = users[users["username"] == username]
-        
-        if user_data.empty:
-            return None
-            
-        return {
-            "username": user_data["username"].values[0],
-            "password": user_data["password"].values[0],
-            "role": user_data["role"].values[0],
-            "created_at": user_data["created_at"].values[0]
-        }
+        return self._users.get(username)
 
     def create_user(self, username: str, password: str, role: str = "user") -> bool:
-        users = self.get_all_users()
-        
-        if username in users["username"].values:
-            return False
-            
-        hashed_password = self._hash_password(password)
-        new_user = pd.DataFrame([[
-            username, 
-            hashed_password, 
-            role,
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ]], columns=["username", "password", "role", "created_at"])
-        
-        users = pd.concat([users, new_user], ignore_index=True)
-        users.to_csv(self.config.USERS_CSV, index=False, encoding="utf-8")
+        with self._users_lock:
+            if username in self._users:
+                return False
+
+            user = {
+                "username": username,
+                "password": self._hash_password(password),
+                "role": role,
+                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            self._users[username] = user
+
+        row = list(self._export_user(user).values())
+        if self._users_writer and not self._users_writer.done():
+            self._pending_users.put_nowait(row)
+        else:
+            self._append_users([row])
         return True
 
+    def _append_users(self, rows: list):
+        with open(self.config.USERS_CSV, mode="a", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _write_pending_users(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        stopping = False
+        while True:
+            if batch:
+                limit = len(batch) + self.config.USERS_FLUSH_BATCH
+                deadline = loop.time() + self.config.USERS_RETRY_INTERVAL
+            else:
+                row = await self._pending_users.get()
+                if row is None:
+                    return
+                batch.append(row)
+                limit = self.config.USERS_FLUSH_BATCH
+                deadline = loop.time() + self.config.USERS_FLUSH_INTERVAL
+
+            while not stopping and len(batch) < limit:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._pending_users.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                else:
+                    batch.append(row)
+
+            try:
+                await run_in_threadpool(self._append_users, batch)
+                batch = []
+            except Exception as exc:
+                self.write_log("ERROR", "Не удалось записать пользователей в users.csv",
+                               extra=f"{len(batch)}: {exc}")
+
+            if stopping:
+                if batch:
+                    self.write_log("ERROR", "Пользователи не сохранены в users.csv",
+                                   extra=", ".join(user_row[0] for user_row in batch))
+                return
+
+    def start_users_writer(self):
+        self._pending_users = asyncio.Queue()
+        self._users_writer = asyncio.create_task(self._write_pending_users())
+
+    async def stop_users_writer(self):
+        if not self._users_writer:
+            return
+
+        if not self._users_writer.done():
+            self._pending_users.put_nowait(None)
+        try:
+            await self._users_writer
+        finally:
+            self._users_writer = None
+
     def verify_user(self, username: str, password: str) -> bool:
         user = self.get_user(username)
         if not user:
             return False
-            
-        hashed_password = self._hash_password(password)
-        return user["password"] == hashed_password
+
+        stored_digest = user["password"]
+        if isinstance(stored_digest, str):
+            try:
+                stored_digest = user["password"] = bytes.fromhex(stored_digest)
+            except ValueError:
+                return False
+
+        return hmac.compare_digest(self._hash_password(password), stored_digest)
 
     def get_users_count(self) -> int:
-        users = self.get_all_users()
-        return len(users)
+        return len(self._users)
 
     def write_log(self, level: str, event: str, username: str = "", extra: str = ""):
-        file_exists = os.path.exists(self.config.LOGS_CSV)
-        with open(self.config.LOGS_CSV, mode="a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(["timestamp", "level", "event", "username", "extra"])
-            writer.writerow([
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                level, event, username, extra
-            ])
+        record = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "level": level,
+            "event": event,
+            "username": username,
+            "extra": extra
+        }
+        with self._log_lock:
+            if self._log_file is None:
+                self._open_log_file()
+            self._log_writer.writerow(record.values())
+            self._recent_logs.append(record)
 
     def get_recent_logs(self, limit: int = 50) -> list:
-        if not os.path.exists(self.config.LOGS_CSV):
-            return []
-        
-        logs_df = pd.read_csv(self.config.LOGS_CSV, encoding="utf-8")
-        return logs_df.tail(limit).to_dict('records')
+        start = max(len(self._recent_logs) - limit, 0)
+        return list(itertools.islice(self._recent_logs, start, None))
+
+    def close(self):
+        with self._log_lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
 
 class SessionManager:
-    def __init__(self, ttl: timedelta):
-        self.sessions: Dict[str, dict] = {}
-        self.ttl = ttl
+    def __init__(self, ttl: float, maxsize: int):
+        self.sessions: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
 
     def create_session(self, username: str) -> str:
-        session_id = str(uuid.uuid4())
-        self.sessions[session_id] = {
-            "created": datetime.now(),
-            "username": username
-        }
+        session_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self.sessions[session_id] = username
         return session_id
 
     def get_username(self, session_id: str) -> Optional[str]:
-        if not session_id or session_id not in self.sessions:
-            return None
-            
-        session = self.sessions[session_id]
-        if datetime.now() - session["created"] > self.ttl:
-            del self.sessions[session_id]
+        if not session_id:
             return None
-            
-        session["created"] = datetime.now()
-        return session["username"]
+
+        with self._lock:
+            username = self.sessions.get(session_id)
+            if username:
+                self.sessions[session_id] = username
+        return username
 
     def delete_session(self, session_id: str):
-        if session_id in self.sessions:
-            del self.sessions[session_id]
+        with self._lock:
+            self.sessions.pop(session_id, None)
+
+class LoginLimiter:
+    def __init__(self, max_attempts: int, ttl: float, maxsize: int):
+        self.failures: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.max_attempts = max_attempts
+
+    def is_blocked(self, client: str) -> bool:
+        return self.failures.get(client, 0) >= self.max_attempts
+
+    def register_failure(self, client: str):
+        self.failures[client] = self.failures.get(client, 0) + 1
+
+class PageCache:
+    PAGES = {
+        "login.html": ("login.html", {}),
+        "registr.html": ("registr.html", {}),
+        "404.html": ("404.html", {}),
+        "403.html": ("403.html", {}),
+        "login_blocked": ("login.html", {"error": "Слишком много неудачных попыток входа. Попробуйте позже"}),
+    }
+
+    def __init__(self, templates: Jinja2Templates, user_service: UserService):
+        self.templates = templates
+        self.user_service = user_service
+        self._pages: Dict[str, tuple] = {}
+
+    def get_page(self, name: str) -> bytes:
+        users_count = self.user_service.get_users_count()
+        cached = self._pages.get(name)
+        if cached and cached[0] == users_count and not self.templates.env.auto_reload:
+            return cached[1]
+
+        template, context = self.PAGES[name]
+        content = self.templates.get_template(template).render(context, users_count=users_count).encode("utf-8")
+        self._pages[name] = (users_count, content)
+        return content
+
+    def prerender(self):
+        for name in self.PAGES:
+            self.get_page(name)
 
 config = Config()
 user_service = UserService(config)
-session_manager = SessionManager(config.SESSION_TTL)
+session_manager = SessionManager(config.SESSION_TTL, config.SESSION_MAX_COUNT)
+login_limiter = LoginLimiter(config.LOGIN_MAX_ATTEMPTS, config.LOGIN_BLOCK_TTL, config.LOGIN_TRACKED_CLIENTS)
 
 app = FastAPI(title="Auth System", version="2.0.0")
 
 app.mount('/static', StaticFiles(directory='static'), name='static')
-templates = Jinja2Templates(directory="templates")
+os.makedirs(config.TEMPLATES_CACHE_DIR, exist_ok=True)
+templates = Jinja2Templates(env=Environment(
+    loader=FileSystemLoader(config.TEMPLATES_DIR),
+    autoescape=True,
+    auto_reload=config.TEMPLATES_AUTO_RELOAD,
+    bytecode_cache=FileSystemBytecodeCache(config.TEMPLATES_CACHE_DIR)
+))
+page_cache = PageCache(templates, user_service)
+
+@app.on_event("startup")
+async def startup():
+    page_cache.prerender()
+    user_service.start_users_writer()
+
+@app.on_event("shutdown")
+async def shutdown():
+    try:
+        await user_service.stop_users_writer()
+    finally:
+        user_service.close()
 
 def get_current_user(request: Request) -> Optional[str]:
     session_id = request.cookies.get('session_id')
     return session_manager.get_username(session_id) if session_id else None
 
-def require_auth(request: Request):
+async def require_auth(request: Request):
     user = get_current_user(request)
     if not user:
         raise HTTPException(status_code=302, headers={"Location": "/login"})
     return user
 
-def require_admin(user: str = Depends(require_auth)):
+async def require_admin(user: str = Depends(require_auth)):
     user_data = user_service.get_user(user)
     if not user_data or user_data["role"] != "admin":
         raise HTTPException(status_code=403, detail="Требуются права администратора")
-    return user
+    return user, user_data
 
-@app.middleware("http")
-async def auth_middleware(request: Request, call_next):
-    path = request.url.path
-    
-    if (path.startswith('/static') or 
-        path in config.WHITE_URLS or 
-        path.startswith("/main")):
-        return await call_next(request)
+class AuthMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-    user = get_current_user(request)
-    if not user:
-        return RedirectResponse(url='/login')
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    response = await call_next(request)
-    return response
+        path = scope["path"]
+        if (path.startswith('/static') or
+            path in config.WHITE_URLS or
+            path.startswith("/main") or
+            get_current_user(Request(scope))):
+            await self.app(scope, receive, send)
+            return
+
+        response = RedirectResponse(url='/login')
+        await response(scope, receive, send)
+
+app.add_middleware(AuthMiddleware)
 
 @app.get("/", response_class=HTMLResponse)
 @app.get("/login", response_class=HTMLResponse)
-def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {
-        "request": request,
-        "users_count": user_service.get_users_count()
-    })
+async def login_page(request: Request):
+    return HTMLResponse(page_cache.get_page("login.html"))
 
 @app.post("/login")
-def login(
+async def login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...)
 ):
+    client = request.client.host if request.client else ""
+    if login_limiter.is_blocked(client):
+        return HTMLResponse(page_cache.get_page("login_blocked"), status_code=429)
+
     username = username.strip()
     password = password.strip()
 
@@ -212,6 +386,14 @@ def login(
             'users_count': user_service.get_users_count()
         }, status_code=200)
 
+    if not user_service.is_valid_username(username):
+        login_limiter.register_failure(client)
+        return templates.TemplateResponse("login.html", {
+            'request': request,
+            'error': 'Неверный логин или пароль',
+            'users_count': user_service.get_users_count()
+        }, status_code=200)
+
     if user_service.verify_user(username, password):
         session_id = session_manager.create_session(username)
         response = RedirectResponse(url=f"/welcome/{username}", status_code=302)
@@ -220,6 +402,7 @@ def login(
         return response
 
     error = "Неверный логин или пароль"
+    login_limiter.register_failure(client)
     user_service.write_log("WARNING", "Неудачная попытка входа", username)
     return templates.TemplateResponse(
         "login.html",
@@ -232,14 +415,11 @@ def login(
     )
 
 @app.get("/register", response_class=HTMLResponse)
-def register_page(request: Request):
-    return templates.TemplateResponse("registr.html", {
-        "request": request,
-        "users_count": user_service.get_users_count()
-    })
+async def register_page(request: Request):
+    return HTMLResponse(page_cache.get_page("registr.html"))
 
 @app.post("/register")
-def register(
+async def register(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
@@ -256,6 +436,13 @@ def register(
             "users_count": user_service.get_users_count()
         }, status_code=200)
 
+    if not user_service.is_valid_username(username):
+        return templates.TemplateResponse("registr.html", {
+            "request": request,
+            "error": "Недопустимое имя пользователя",
+            "users_count": user_service.get_users_count()
+        }, status_code=200)
+
     if (admin_login != config.ADMIN_LOGIN or 
         admin_password != config.ADMIN_PASSWORD):
         return templates.TemplateResponse("registr.html", {
@@ -286,7 +473,7 @@ def register(
     }, status_code=200)
 
 @app.get("/welcome/{username}", response_class=HTMLResponse)
-def welcome_page(request: Request, username: str, current_user: str = Depends(require_auth)):
+async def welcome_page(request: Request, username: str, current_user: str = Depends(require_auth)):
     if current_user != username:
         raise HTTPException(status_code=403, detail="Доступ запрещен")
 
@@ -302,8 +489,9 @@ def welcome_page(request: Request, username: str, current_user: str = Depends(re
     })
 
 @app.get("/main/{username}", response_class=HTMLResponse)
-def admin_panel(request: Request, username: str, admin: str = Depends(require_admin)):
-    if admin != username:
+async def admin_panel(request: Request, username: str, admin: tuple = Depends(require_admin)):
+    admin_name, admin_data = admin
+    if admin_name != username:
         raise HTTPException(status_code=403, detail="Доступ запрещен")
 
     users = user_service.get_all_users()
@@ -312,14 +500,15 @@ def admin_panel(request: Request, username: str, admin: str = Depends(require_ad
     return templates.TemplateResponse("main.html", {
         "request": request, 
         "username": username,
-        "users": users.to_dict('records'),
+        "user_data": admin_data,
+        "users": users,
         "recent_logs": recent_logs,
         "users_count": len(users),
         "logs_count": len(recent_logs)
     })
 
 @app.get("/logout")
-def logout(request: Request):
+async def logout(request: Request):
     session_id = request.cookies.get("session_id")
     if session_id:
         username = session_manager.get_username(session_id)
@@ -332,31 +521,24 @@ def logout(request: Request):
     return response
 
 @app.get("/api/users")
-def get_users_api(admin: str = Depends(require_admin)):
-    users = user_service.get_all_users()
-    return users.to_dict('records')
+async def get_users_api(admin: tuple = Depends(require_admin)):
+    return user_service.get_all_users()
 
 @app.get("/api/logs")
-def get_logs_api(admin: str = Depends(require_admin)):
+async def get_logs_api(admin: tuple = Depends(require_admin)):
     logs = user_service.get_recent_logs(100)
     return logs
 
 @app.exception_handler(404)
-def not_found_handler(request: Request, exc):
-    return templates.TemplateResponse("404.html", {
-        "request": request,
-        "users_count": user_service.get_users_count()
-    }, status_code=404)
+async def not_found_handler(request: Request, exc):
+    return HTMLResponse(page_cache.get_page("404.html"), status_code=404)
 
 @app.exception_handler(403)
-def forbidden_handler(request: Request, exc):
-    return templates.TemplateResponse("403.html", {
-        "request": request,
-        "users_count": user_service.get_users_count()
-    }, status_code=403)
+async def forbidden_handler(request: Request, exc):
+    return HTMLResponse(page_cache.get_page("403.html"), status_code=403)
 
 @app.exception_handler(RequestValidationError)
-def validation_exception_handler(request: Request, exc):
+async def validation_exception_handler(request: Request, exc):
     return PlainTextResponse("Ошибка запроса", status_code=400)
 
 if __name__ == "__main__":
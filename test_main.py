@@ -0,0 +1,50 @@
+import importlib
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    shutil.copytree(ROOT / "templates", tmp_path / "templates")
+    shutil.copytree(ROOT / "static", tmp_path / "static")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(ROOT))
+    sys.modules.pop("main", None)
+    yield importlib.import_module("main")
+    sys.modules.pop("main", None)
+
+
+def register(client, username):
+    return client.post("/register", data={
+        "username": username,
+        "password": "secret",
+        "admin_login": "admin",
+        "admin_password": "12345"
+    }, follow_redirects=False)
+
+
+def test_register_in_consecutive_lifespans(main):
+    for username in ("carl", "dave"):
+        with TestClient(main.app) as client:
+            assert register(client, username).status_code == 302
+            response = client.post("/login", data={"username": username, "password": "secret"},
+                                   follow_redirects=False)
+            assert response.status_code == 302
+
+    with open(main.config.USERS_CSV, encoding="utf-8") as f:
+        saved = [line.split(",")[0] for line in f.read().splitlines()]
+    assert saved == ["username", "admin", "carl", "dave"]
+
+
+def test_recent_logs_limit(main):
+    main.user_service.write_log("INFO", "first")
+    main.user_service.write_log("INFO", "second")
+
+    assert main.user_service.get_recent_logs(0) == []
+    assert [log["event"] for log in main.user_service.get_recent_logs(2)] == ["first", "second"]